@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+import mmap
+import struct
+import sys
+from array import array
+
+# Compiled problem format (all integers are little-endian):
+#
+# - header      : magic ("CPTR"), format version (uint32)
+# - counts      : names, rules, undefined modules, system modules and costs,
+#                 byte lengths of names and text (7 x uint32)
+# - names       : distinct module names, utf-8 encoded and separated by "\n"
+# - text        : rule heads, rule body templates and system modules, utf-8
+#                 encoded and separated by "\n"
+# - rules       : name ids (uint32 array) and quantifier counts (uint16
+#                 array) of rule heads
+# - undefined   : name ids (uint32 array) and quantifier counts (uint16
+#                 array) of modules that are only used in rule bodies
+# - costs       : name ids (uint32 array) followed by costs (int32 array)
+#
+# Compiled problems are stored parsed but before grounding (see
+# parser.parse_defined), so that several compiled (or json) files can be
+# merged before the problem is grounded against the merged system. Rule
+# bodies are stored as templates (see parser.parse_definitions), and all
+# sections are read in bulk, so loading does not build per-token objects.
+# Meta rules are applied before compiling.
+
+magic = "CPTR"
+version = 3
+header = struct.Struct("<4sI")
+counts = struct.Struct("<7I")
+
+def is_compiled(file):
+	"""
+	Return True if `file` is a compiled problem.
+	"""
+	with open(file, "rb") as f:
+		return f.read(len(magic)) == magic
+
+def pack(typecode, items):
+	return struct.pack("<%d%s" % (len(items), typecode), *items)
+
+def write(file, content):
+	"""
+	Write problem content to a compiled problem file.
+
+	`content` is a dict with the (parsed) entries "definitions", "rules"
+	(see parser.parse_definitions), "system" and "costs".
+	"""
+	module_defs, rules = content["definitions"], content["rules"]
+	heads = [head.split()[0] for head, _ in rules]
+	undefined = sorted(name for name, (_, body) in module_defs.iteritems() \
+		if body is None)
+	cost_items = sorted(content["costs"].iteritems())
+	names = sorted(set(heads + undefined + [name for name, _ in cost_items]))
+	text = [head for head, _ in rules] + [body for _, body in rules] + \
+		list(content["system"])
+	if any("\n" in item for item in names + text):
+		raise Exception("Cannot compile names containing line breaks")
+	ids = {name: ind for ind, name in enumerate(names)}
+	names_bytes = "\n".join(names).encode("utf-8")
+	text_bytes = "\n".join(text).encode("utf-8")
+	sections = [
+		names_bytes,
+		text_bytes,
+		pack("I", [ids[name] for name in heads]),
+		pack("H", [len(head.split()) - 1 for head, _ in rules]),
+		pack("I", [ids[name] for name in undefined]),
+		pack("H", [module_defs[name][0] for name in undefined]),
+		pack("I", [ids[name] for name, _ in cost_items]),
+		pack("i", [cost for _, cost in cost_items])
+	]
+	with open(file, "wb") as f:
+		f.write(header.pack(magic, version))
+		f.write(counts.pack(len(names), len(rules), len(undefined),
+			len(content["system"]), len(cost_items), len(names_bytes),
+			len(text_bytes)))
+		for section in sections:
+			f.write(section)
+
+def read(file):
+	"""
+	Load a compiled problem file (using memory mapping).
+
+	Return problem content in the format accepted by `write`.
+	"""
+	with open(file, "rb") as f:
+		mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+	try:
+		file_magic, file_version = header.unpack_from(mm, 0)
+		if file_magic != magic or file_version != version:
+			raise Exception("Unsupported compiled problem file: %s" % file)
+		n_names, n_rules, n_undefined, n_system, n_costs, names_len, \
+			text_len = counts.unpack_from(mm, header.size)
+		start = header.size + counts.size
+		names = mm[start:start + names_len].decode("utf-8").split("\n")
+		start += names_len
+		text = mm[start:start + text_len].decode("utf-8").split("\n")
+		pos = [start + text_len]
+		def section(typecode, length):
+			# arrays are copied from the mapped file in bulk
+			items = array(typecode)
+			end = pos[0] + items.itemsize * length
+			items.fromstring(mm[pos[0]:end])
+			pos[0] = end
+			if sys.byteorder == "big":
+				items.byteswap()
+			return items
+		head_ids = section("I", n_rules)
+		quantifiers = section("H", n_rules)
+		undefined_ids = section("I", n_undefined)
+		undefined_quantifiers = section("H", n_undefined)
+		cost_ids = section("I", n_costs)
+		cost_vals = section("i", n_costs)
+	finally:
+		mm.close()
+	heads, bodies = text[:n_rules], text[n_rules:2 * n_rules]
+	module_defs = dict(zip([names[ind] for ind in undefined_ids],
+		zip(undefined_quantifiers, [None] * n_undefined)))
+	module_defs.update(zip([names[ind] for ind in head_ids],
+		zip(quantifiers, bodies)))
+	return {
+		"definitions": module_defs,
+		"rules": zip(heads, bodies),
+		"system": text[2 * n_rules:2 * n_rules + n_system],
+		"costs": dict(zip([names[ind] for ind in cost_ids], cost_vals))
+	}
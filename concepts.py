@@ -1,8 +1,103 @@
 #!/usr/bin/env python
 
-from collections import namedtuple
-
-class Literal(namedtuple("Literal", "signal polarity")):
+def get_concept(id):
+	"""
+	Return concept with (dense integer) identifier `id`.
+	"""
+	return Concept.instances[id]
+
+class Interned(type):
+	"""
+	Metaclass of concepts, gives each concept class its own intern table.
+	"""
+
+	def __init__(cls, name, bases, namespace):
+		super(Interned, cls).__init__(name, bases, namespace)
+		cls.table = {} # dict: args -> instance
+
+class Concept(object):
+	"""
+	Base class of interned concepts.
+
+	Calling a concept class returns the unique instance for its (canonical)
+	arguments, creating it if necessary. Each instance has a dense integer
+	identifier (`id`). Equality is identity, so concepts use the default
+	(identity) hash, which is computed in C and needs no storage. Arguments
+	are stored in the slots named by the class's `__slots__`. Concepts do not
+	define comparison operators (which would slow down `==`), use `get_key`
+	to sort them.
+
+	Classes whose arguments have a canonical order override `canonicalize`.
+	Both the given and the canonical arguments are added to the intern
+	table, so `canonicalize` only runs the first time an argument tuple is
+	seen.
+	"""
+
+	__metaclass__ = Interned
+
+	__slots__ = ("args", "id")
+
+	instances = [] # list: id -> instance
+
+	def __new__(cls, *args):
+		instance = cls.table.get(args)
+		if instance is None:
+			instance = cls.intern(args)
+		return instance
+
+	@classmethod
+	def intern(cls, args):
+		if len(args) != len(cls.__slots__):
+			raise TypeError("%s takes %d arguments (%d given)" % (
+				cls.__name__, len(cls.__slots__), len(args)))
+		canonical = cls.canonicalize(args)
+		instance = cls.table.get(canonical)
+		if instance is None:
+			instance = object.__new__(cls)
+			set_slot = object.__setattr__
+			for name, value in zip(cls.__slots__, canonical):
+				set_slot(instance, name, value)
+			set_slot(instance, "args", canonical)
+			set_slot(instance, "id", len(Concept.instances))
+			cls.table[canonical] = instance
+			Concept.instances.append(instance)
+		if canonical is not args:
+			cls.table[args] = instance
+		return instance
+
+	@staticmethod
+	def canonicalize(args):
+		return args
+
+	def __setattr__(self, name, value):
+		raise AttributeError("concepts are immutable")
+
+	def __reduce__(self):
+		return (type(self), self.args) # unpickled instances are interned
+
+	def __repr__(self):
+		args = ", ".join(map(repr, self.args))
+		return "%s(%s)" % (type(self).__name__, args)
+
+	def get_key(self):
+		"""
+		Return key ordering concepts by class name and arguments.
+		"""
+		return (type(self).__name__, tuple(map(get_sort_key, self.args)))
+
+def get_sort_key(item):
+	return item.get_key() if isinstance(item, Concept) else item
+
+def ordered_pair(args):
+	"""
+	Canonicalize `args` by ordering its first two items.
+	"""
+	first, second = sorted(args[:2], key=get_sort_key)
+	return (first, second) + tuple(args[2:])
+
+class Literal(Concept):
+
+	__slots__ = ("signal", "polarity")
 
 	def __str__(self):
 		return self.signal + self.polarity
@@ -11,65 +106,75 @@ class Literal(namedtuple("Literal", "signal polarity")):
 		oppo_polarity = "-" if (self.polarity == "+") else "+"
 		return Literal(self.signal, oppo_polarity)
 
-class Cause(namedtuple("Cause", "cond transition")):
+class Cause(Concept):
+
+	__slots__ = ("cond", "transition")
 
 	def __str__(self):
 		return "cause %s %s" % (self.cond, self.transition)
 
-class OrCause(namedtuple("OrCause", "cond1 cond2 transition")):
+class OrCause(Concept):
+
+	__slots__ = ("cond1", "cond2", "transition")
 
-	def __get_ordered(self):
-		return (self.cond1, self.cond2) if (self.cond1 < self.cond2) \
-			else (self.cond2, self.cond1)
+	canonicalize = staticmethod(ordered_pair)
 
 	def __str__(self):
 		return "or_cause %s %s %s" % (self.cond1, self.cond2, self.transition)
 
-	def __eq__(self, x):
-		if type(x) is not OrCause:
-			return False
-		tran_match = self.transition == x.transition
-		cond_match = self.__get_ordered() == x.__get_ordered()
-		return tran_match and cond_match
+class OrGate(Concept):
+
+	__slots__ = ("a", "b", "y")
+
+	canonicalize = staticmethod(ordered_pair)
+
+	def __str__(self):
+		return "orGate %s %s %s" % (self.a, self.b, self.y)
+
+class NorGate(Concept):
+
+	__slots__ = ("a", "b", "y")
+
+	canonicalize = staticmethod(ordered_pair)
+
+	def __str__(self):
+		return "norGate %s %s %s" % (self.a, self.b, self.y)
 
-	def __hash__(self):
-		ordered = self.__get_ordered()
-		return hash((ordered, self.transition))
+class AndGate(Concept):
 
-class OrGate(namedtuple("OrGate", "a b y")):
+	__slots__ = ("a", "b", "y")
 
-	def __get_ordered(self):
-		return (self.a, self.b) if (self.a < self.b) else (self.b, self.a)
+	canonicalize = staticmethod(ordered_pair)
 
 	def __str__(self):
-		ordered = self.__get_ordered()
-		return "orGate %s %s %s" % (ordered[0], ordered[1], self.y)
+		return "andGate %s %s %s" % (self.a, self.b, self.y)
 
-	def __eq__(self, other):
-		output_match = self.y == other.y
-		input_match = self.__get_ordered() == other.__get_ordered()
-		return output_match and input_match
+class Buffer(Concept):
 
-	def __hash__(self):
-		ordered = self.__get_ordered(self)
-		return hash((ordered, self.y))
+	__slots__ = ("a", "y")
+
+	def __str__(self):
+		return "buffer %s %s" % (self.a, self.y)
+
+class Inverter(Concept):
+
+	__slots__ = ("a", "y")
+
+	def __str__(self):
+		return "inverter %s %s" % (self.a, self.y)
+
+class CElement(Concept):
+
+	__slots__ = ("a", "b", "y")
+
+	canonicalize = staticmethod(ordered_pair)
+
+	def __str__(self):
+		return "cElement %s %s %s" % (self.a, self.b, self.y)
 
-class NorGate(namedtuple("NorGate", "a b y")):
+class Handshake(Concept):
 
-	def __get_ordered(self):
-		return (self.a, self.b) if (self.a < self.b) else (self.b, self.a)
+	__slots__ = ("b", "c")
 
 	def __str__(self):
-		ordered = self.__get_ordered()
-		return "norGate %s %s %s" % (ordered[0], ordered[1], self.y)
-
-	def __eq__(self, other):
-		if type(other) is not NorGate:
-			return False
-		output_match = self.y == other.y
-		input_match = self.__get_ordered() == other.__get_ordered()
-		return output_match and input_match
-
-	def __hash__(self):
-		ordered = self.__get_ordered()
-		return hash((ordered, self.y))
+		return "handshake %s %s" % (self.b, self.c)
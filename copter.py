@@ -1,18 +1,28 @@
 #!/usr/bin/env python
 
+import sys
 import graphs
 import json
 import parser
 import docopt
 import traceback
-from z3 import *
 from time import time
+from collections import Counter
 
 usage = """Composability Optimizer (Copter)
 
 Usage:
   copter.py [--mode=<m>] [--output=<file>] [--quiet|--print]
-            [--costs=<list>] <problem.json>...
+            [--costs=<list>] [--dry-run|--emit-smt2=<file>]
+            [--strategy=<s>] [--jobs=<n>] [--portfolio-log=<file>]
+            [--timeout=<sec>] [--no-warm-start|--greedy-bound]
+            [--objectives=<list> [--pareto]] <problem.json>...
+  copter.py [--output=<file>] [--quiet] --from-smt2=<file>
+  copter.py [--costs=<list>] --compile=<file> <problem.json>...
+  copter.py [--mode=<m>] [--costs=<list>] [--quiet] --verify=<file>
+            <problem.json>...
+  copter.py [--mode=<m>] [--costs=<list>] [--timeout=<sec>] --interactive
+            <problem.json>...
   copter.py --version
 
 Options:
@@ -21,6 +31,23 @@ Options:
   -c --costs=<list>   Override costs (<list> is mod1:cost1,mod2:cost2 ...).
   -p --print          Print problem (rules, costs and system).
   -q --quiet          Suppress output.
+  -n --dry-run        Load, ground and prune problem without solving.
+  --emit-smt2=<file>  Write encoded problem to SMT-LIB2 file (and a
+                      <file>.json variable map) without solving.
+  --from-smt2=<file>  Solve problem previously written by --emit-smt2.
+  -s --strategy=<s>   Choose solve strategy (exact/portfolio/hierarchical)
+                      [default: exact].
+  -j --jobs=<n>       Maximum number of portfolio processes.
+  --portfolio-log=<file>
+                      Append winning portfolio configuration to file.
+  -t --timeout=<sec>  Stop solver after timeout and report best solution.
+  --no-warm-start     Do not compute a greedy solution before solving.
+  --greedy-bound      Bound objective by the cost of the greedy solution.
+  --objectives=<list> Optimize objectives in order (<list> is obj1,obj2 ...).
+  --pareto            Report Pareto front of objectives.
+  --compile=<file>    Write problem to a compiled (binary) file.
+  --verify=<file>     Check that solution file is equivalent to problem system.
+  -i --interactive    Edit system and re-solve incrementally.
 
 """
 
@@ -35,17 +62,13 @@ def get_atoms(rules):
 	atoms = set(modules).difference(non_atoms)
 	return list(atoms)
 
-def prune_problem(problem):
+def get_family(system, closure, rev_closure):
 	"""
-	Remove rules that cannot be applied to the system.
+	Return set of modules whose rules can be applied to the system.
+
+	`closure` and `rev_closure` are the closures of the rule graph and its
+	reverse (see graphs.get_closure).
 	"""
-	system = problem["system"]
-	rules = problem["rules"]
-	# compute closure and reverse closure
-	rev_rules = graphs.get_reversed(rules)
-	closure = graphs.get_closure(rules)
-	rev_closure = graphs.get_closure(rev_rules)
-	# compute lineage and family
 	lineage = set() # ancestors and descendents of modules in system
 	lineage.update(system)
 	for module in system:
@@ -55,146 +78,310 @@ def prune_problem(problem):
 	for module in lineage:
 		family.update(closure.get(module, []))
 		family.update(rev_closure.get(module, []))
+	return family
+
+def prune_problem(problem):
+	"""
+	Remove rules that cannot be applied to the system.
+	"""
+	rules = problem["rules"]
+	closure = graphs.get_closure(rules)
+	rev_closure = graphs.get_closure(graphs.get_reversed(rules))
+	family = get_family(problem["system"], closure, rev_closure)
 	# keep rules of family members, remove everything else
 	problem["rules"] = {k:v for k,v in rules.iteritems() if k in family}
 
-def optimize(problem, mode="unique"):
+def get_pedigrees(rules):
+	"""
+	Return dict: atom -> list of modules that decompose into atom.
 
-	# in "unique" mode : a . a == a
-	# in "count" mode  : a . a != a
+	The pedigree of an atom includes all its ancestors and the atom itself.
+	"""
+	ancestor_graph = graphs.get_closure(graphs.get_reversed(rules))
+	return {a: list(ancestor_graph[a]) + [a] for a in get_atoms(rules)}
 
+def prepare_problem(problem):
+	"""
+	Prune problem and return (modules, pedigrees, system, costs).
+	"""
 	prune_problem(problem)
-
 	rules, system = problem["rules"], problem["system"]
-
 	costs = problem.get("costs", {})
+	modules = graphs.get_nodes(rules)
+	pedigrees = get_pedigrees(rules)
+	return modules, pedigrees, system, costs
 
-	solver = Optimize()
+def encode(problem, mode="unique"):
+	"""
+	Prune problem and encode it as a Z3 optimization problem.
 
-	modules = graphs.get_nodes(rules)
+	Return (z3_solver, variables), see `solver.encode`.
+	"""
 
-	atoms = get_atoms(rules)
+	# in "unique" mode : a . a == a
+	# in "count" mode  : a . a != a
 
-	parent_graph = graphs.get_reversed(rules)
+	# the solver backend (and Z3) is only imported when solving
+	import solver
 
-	ancestor_graph = graphs.get_closure(parent_graph)
+	modules, pedigrees, system, costs = prepare_problem(problem)
 
-	d = {} # dict: module -> (z3_int, z3_int)
+	return solver.encode(modules, pedigrees, system, costs, mode)
 
-	# note: iff is no longer needed but removing it causes a segmentation
-	# fault for some reason (TODO: debug)
-	iff = Function('iff', BoolSort(), BoolSort(), BoolSort())
-	solver.add(iff(False, False) == True)
-	solver.add(iff(False, True)  == False)
-	solver.add(iff(True,  False) == False)
-	solver.add(iff(True,  True)  == True)
+def optimize(problem, mode="unique", strategy="exact", jobs=None,
+	timeout=None, warm_start=True, greedy_bound=False, objectives=None,
+	pareto=False):
+	"""
+	Solve problem using one of the strategies:
+
+	- "exact"     : a single Z3 run.
+	- "portfolio" : several solver configurations in parallel processes (up
+	                to `jobs`), first to finish wins (see portfolio.py).
+	- "hierarchical" : solve level by level by rule depth, then confirm
+	                optimality with a time-limited exact solve (see
+	                hierarchy.py).
+
+	In "exact" strategy, a greedy cover (see greedy.py) is first computed
+	(unless `warm_start` is False) to provide an initial assignment and, if
+	`greedy_bound` is True, to bound the objective. The greedy cover is
+	returned if the solver times out (`timeout` is in seconds) or is
+	interrupted before finding a better one.
+
+	If `objectives` (see `parse_objectives`) are given then they are
+	optimized lexicographically instead of cost, or as a Pareto front if
+	`pareto` is True ("exact" strategy only).
+	"""
+	modules, pedigrees, system, costs = prepare_problem(problem)
+	if strategy == "portfolio":
+		import portfolio
+		return portfolio.optimize(modules, pedigrees, system, costs, mode, jobs)
+	if strategy == "hierarchical":
+		import hierarchy
+		rules = problem["rules"]
+		return hierarchy.optimize(rules, modules, pedigrees, system, costs,
+			mode, timeout)
+	import solver
+	import greedy
+	if objectives:
+		z3_solver, variables = solver.encode(modules, pedigrees, system,
+			costs, mode, objective=None)
+		exprs = solver.add_objectives(z3_solver, variables, costs, objectives,
+			pareto)
+		solve = solver.solve_pareto if pareto else solver.solve
+		return solve(z3_solver, variables, costs, mode, timeout, exprs)
+	fallback = None
+	if warm_start:
+		fallback = greedy.solve(modules, pedigrees, system, costs, mode)
+	z3_solver, variables = solver.encode(modules, pedigrees, system, costs, mode)
+	if fallback:
+		counts = Counter(fallback["system"])
+		solver.add_warm_start(z3_solver, variables, costs, counts,
+			greedy_bound)
+	start = time()
+	try:
+		solution = solver.solve(z3_solver, variables, costs, mode, timeout)
+	except KeyboardInterrupt:
+		solution = solver.get_timeout(time() - start)
+	if fallback and (solution is None or not solution["optimal"]):
+		if not has_system(solution) or fallback["cost"] < solution["cost"]:
+			return fallback
+	return solution
+
+def emit_smt2(file, problem, mode="unique"):
+	"""
+	Encode problem and write it to an SMT-LIB2 file.
+	"""
+	import solver
+	z3_solver, variables = encode(problem, mode)
+	costs = problem.get("costs", {})
+	solver.write_smt2(file, z3_solver, variables, costs, mode)
 
-	# constraints
+def optimize_smt2(file):
+	"""
+	Solve a problem written by `emit_smt2`.
+	"""
+	import solver
+	z3_solver, variables, costs, mode = solver.read_smt2(file)
+	return solver.solve(z3_solver, variables, costs, mode)
 
-	for module in modules:
-		mod = Int(module) # Z3 object
-		d[module] = mod
-		if mode in ["unique", "inclusive"]:
-			constraint = Or(mod == 0, mod == 1)
-		elif mode == "count":
-			constraint = mod >= 0
+def split_names(text, separator):
+	"""
+	Split `text` at occurrences of `separator` that are not enclosed in
+	parentheses or double quotes, and remove enclosing quotes of each part.
+
+	For example, 'cause(a+,b+)+"buffer a+ b"' split at "+" gives
+	['cause(a+,b+)', 'buffer a+ b'].
+	"""
+	parts, current = [], []
+	depth, quoted = 0, False
+	for char in text:
+		if char == '"':
+			quoted = not quoted
+		elif not quoted and char == "(":
+			depth += 1
+		elif not quoted and char == ")":
+			depth -= 1
+		elif char == separator and not quoted and depth == 0:
+			parts.append("".join(current))
+			current = []
+			continue
+		current.append(char)
+	if quoted or depth:
+		raise Exception("Unbalanced quotes or parentheses: %s" % text)
+	parts.append("".join(current))
+	unquote = lambda x : x[1:-1] if len(x) > 1 and x[0] == x[-1] == '"' else x
+	return map(unquote, parts)
+
+def parse_objectives(objectives_str):
+	"""
+	Parse objectives string in the form 'obj1,obj2,...' where each objective
+	is one of:
 
-		solver.add(constraint)
+	- cost                    : minimize total cost
+	- modules                 : minimize number of modules
+	- exclude:mod1+mod2+...   : minimize number of excluded modules
+	- require:mod1+mod2+...   : maximize number of required modules
 
-	in_system = lambda module : 1 if module in system else 0
-	count_inst = lambda module : sum([1 if x == module else 0 for x in system])
+	Modules can be given by full name (e.g. 'buffer a b' or 'buffer(a,b)')
+	or by name only (e.g. 'buffer', matching all buffers). Separators within
+	parentheses are ignored and names containing separators at top level
+	(e.g. 'cause a+ b+') can be enclosed in double quotes.
 
-	for a in atoms:
-		pedigree = list(ancestor_graph[a]) + [a]
-		if mode in ["unique", "inclusive"]:
-			p1 = [in_system(ancestor) for ancestor in pedigree]
-		else:
-			p1 = [count_inst(ancestor) for ancestor in pedigree]
-		p2 = [d[ancestor] for ancestor in pedigree] # Z3 object
-		s1 = sum(p1)
-		s2 = sum(p2) # Z3 object
-		if mode == "unique":
-			solver.add((s2>0) if (s1>0) else (s2==0))
-		elif mode == "inclusive":
-			if s1>0:
-				solver.add(s2>0)
-		elif mode == "count":
-			solver.add(s1 == s2)
-
-	cost_list = [d[module] * costs.get(module, 1) for module in modules]
-
-	start_solve = time()
-
-	solver.minimize(sum(cost_list))
-
-	end_solve = time()
-
-	if solver.check() == sat:
-		m = solver.model()
-		counts = {c:m[d[c]].as_long() for c in modules}
-		sol_cost_list = [counts[c] * costs.get(c, 1) for c in modules]
-		solution = {
-			"cost": sum(sol_cost_list),
-			"solve_time": (end_solve - start_solve).real
-		}
-		if mode == "unique":
-			solution["system"] = [c for c in modules if m[d[c]].as_long() > 0]
-		else:
-			solution["system"] = []
-			for module in modules:
-				units = m[d[module]].as_long()
-				if units > 0:
-					solution["system"] += [module] * units
-		return solution
-	else:
-		print None
+	Return list of (kind, list of modules) tuples.
+	"""
+	objectives = []
+	for item in split_names(objectives_str, ","):
+		kind, _, names_str = item.partition(":")
+		names = split_names(names_str, "+") if names_str else []
+		if kind not in ["cost", "modules", "exclude", "require"]:
+			raise Exception("Invalid objective: %s" % item)
+		if bool(names) != (kind in ["exclude", "require"]):
+			raise Exception("Invalid objective: %s" % item)
+		if not all(names):
+			raise Exception("Invalid objective: %s" % item)
+		objectives.append((kind, names))
+	return objectives
+
+def has_system(solution):
+	"""
+	Return True if `solution` is neither unsat (None) nor a timeout result.
+	"""
+	return solution is not None and "system" in solution
 
 def print_solution(solution):
-	print "Z3 Time: %1.2f sec"% solution["solve_time"]
-	print ""
 	if solution is None:
 		print "unsat"
+	elif not has_system(solution):
+		print "timeout (no solution found in %1.2f sec)" % \
+			solution["solve_time"]
 	else:
+		print "Z3 Time: %1.2f sec"% solution["solve_time"]
+		if "portfolio" in solution:
+			print "Portfolio Winner: %s" % solution["portfolio"]["winner"]
+		if "hierarchy" in solution:
+			for level in solution["hierarchy"]["levels"]:
+				print "Level %(depth)d: %(candidates)d candidates, " \
+					"cost = %(cost)d" % level
+		if solution.get("gap") is not None and not solution["optimal"]:
+			print "Optimality Gap: %d" % solution["gap"]
+		print ""
+		optimal = solution.get("optimal", True)
 		lines = [
-			"Solution (cost = %d):" % solution["cost"],
+			"Solution (cost = %d%s):" % (solution["cost"],
+				"" if optimal else ", not proven optimal"),
 			"",
 			" . ".join(solution["system"]),
 		]
 		for line in lines:
 			print line
+		if "objectives" in solution:
+			print ""
+			print "Objectives:"
+		for name, value in solution.get("objectives", []):
+			print "    - %-24s : %d" % (name, value)
+		if "pareto" in solution:
+			print ""
+			print "Pareto Front (%d solutions):" % len(solution["pareto"])
+			for point in solution["pareto"]:
+				values = ", ".join(["%s = %d" % o for o in point["objectives"]])
+				print ""
+				print "    %s:" % values
+				print "    %s" % " . ".join(point["system"])
+
+def verify_solution(problem, solution, mode="unique"):
+	"""
+	Check solution against problem system, return report (see verify.py).
+	"""
+	import verify
+	rules, system = problem["rules"], problem["system"]
+	return verify.verify(rules, system, solution["system"], mode)
 
 def write_solution(file, solution):
 	with open(file, "w") as f:
 		json.dump(solution, f, indent=4)
 
+def parse_costs(override_costs):
+	"""
+	Parse string in the form 'mod1:cost1,mod2:cost2...', return dict.
+	"""
+	costs = {}
+	try:
+		if override_costs:
+			for item in override_costs.split(","):
+				module, cost_str = item.split(":")
+				costs[module] = int(cost_str)
+	except ValueError as e:
+		print "Invalid --costs argument, correct form is --costs=mod1:cost1,mod2:cost,...\n"
+		raise(e)
+	return costs
+
 def load_problem(files, override_costs):
 	"""
-	Load problem by concatenating `rules`, `costs` and `system` entries in a
-	list of files.
+	Load and ground problem from a list of files (see `load_content`).
+	"""
+	content = load_content(files, override_costs)
+	if content is None:
+		return None
+	return parser.parse_defined(content)
+
+def load_content(files, override_costs):
+	"""
+	Load problem content (before grounding) by concatenating `rules`,
+	`costs` and `system` entries in a list of files.
 
 	If conflicting `costs` entries are present then those in later files
 	take priority.
 
 	`override_costs` is a string in the form 'mod1:cost1,mod2:cost2...'].
 	Cost definitions in `override_costs` take precedence over those in files.
+
+	Files can be json files or compiled problems (see compiled.py). Rules
+	are returned parsed (see parser.parse_defined).
 	"""
+	import compiled
 	all_content = {
+		"definitions": {},
 		"rules" : [],
 		"costs": {},
 		"system": [],
 		"input-meta-rules": {}
 	}
 	# load file content
+	contents = []
 	for file in files:
-		try:
-			with open(file, "r") as f:
-				content = json.load(f)
-		except ValueError as e:
-			print "Could not load file %s\n" % file
-			print e
-			return None
-		if "rules" in content:
-			all_content["rules"] += content["rules"]
+		if compiled.is_compiled(file):
+			content = compiled.read(file)
+		else:
+			try:
+				with open(file, "r") as f:
+					content = json.load(f)
+			except ValueError as e:
+				print "Could not load file %s\n" % file
+				print e
+				return None
+			content["rules"] = map(parser.parse_definition,
+				content.get("rules", []))
+		contents.append(content)
 		if "system" in content:
 			system = content["system"]
 			if type(system) is not list:
@@ -207,21 +394,32 @@ def load_problem(files, override_costs):
 		if "input-meta-rules" in content:
 			for module, cost in content["input-meta-rules"].iteritems():
 				all_content["input-meta-rules"][module] = cost
+	# apply meta rules (of all files) and merge rules in file order
+	meta_rules = all_content.pop("input-meta-rules")
+	for content in contents:
+		if "definitions" not in content:
+			problem = {"rules": content["rules"], "system": [],
+				"input-meta-rules": meta_rules}
+			parser.preprocess_problem(problem)
+			content["definitions"], content["rules"] = \
+				parser.parse_definitions(problem["rules"])
+		elif meta_rules:
+			raise Exception("Meta rules cannot be applied to compiled problems")
+		parser.merge_definitions(all_content["definitions"],
+			content["definitions"])
+		all_content["rules"] += content["rules"]
+	problem = {"rules": [], "system": all_content["system"],
+		"input-meta-rules": meta_rules}
+	parser.preprocess_problem(problem)
+	all_content["system"] = problem["system"]
 	# process cost overrides
-	try:
-		if override_costs:
-			for item in override_costs.split(","):
-				module, cost_str = item.split(":")
-				all_content["costs"][module] = int(cost_str)
-	except ValueError as e:
-		print "Invalid --costs argument, correct form is --costs=mod1:cost1,mod2:cost,...\n"
-		raise(e)
-	return parser.parse(all_content)
+	all_content["costs"].update(parse_costs(override_costs))
+	return all_content
 
 def print_problem(problem):
 	print "Rules:"
 	for r in problem["source"]["rules"]:
-		parts = r.split("=")
+		parts = parser.format_definition(r).split("=")
 		print "    - %-24s = %s" % (parts[0], ". ".join(parts[1:]))
 	print "\nCosts:"
 	for module, cost in problem["source"]["costs"].iteritems():
@@ -233,14 +431,19 @@ def print_problem(problem):
 		print "    - %-24s" % module
 	print ""
 
-def print_problem_stats(problem):
-	stats = [
+def get_problem_stats(problem):
+	return [
 		("System Modules", len(problem["system"])),
 		("Defined Costs", len(problem["source"]["costs"])),
 		("Defined Rules", len(problem["source"]["rules"])),
 		("Expanded Costs", len(problem["costs"])),
-		("Expanded Rules", len(problem["rules"]))
+		("Expanded Rules", len(problem["rules"])),
+		("Modules", len(graphs.get_nodes(problem["rules"]))),
+		("Atoms", len(get_atoms(problem["rules"])))
 	]
+
+def print_problem_stats(problem):
+	stats = get_problem_stats(problem)
 	print "Problem Statistics:"
 	for tup in stats:
 		print "    - %-24s : %d" % tup
@@ -248,6 +451,20 @@ def print_problem_stats(problem):
 
 def main():
 	args = docopt.docopt(usage, version="Composability Optimizer (Copter) 0.1")
+	if args["--from-smt2"]:
+		solution = optimize_smt2(args["--from-smt2"])
+		if args["--output"]:
+			write_solution(args["--output"], solution)
+		if not args["--quiet"]:
+			print_solution(solution)
+		return
+	if args["--compile"]:
+		import compiled
+		content = load_content(args["<problem.json>"], args["--costs"])
+		if not content:
+			sys.exit(1)
+		compiled.write(args["--compile"], content)
+		return
 	try:
 		problem = load_problem(args["<problem.json>"], args["--costs"])
 	except Exception as e:
@@ -255,18 +472,69 @@ def main():
 		tb = traceback.format_exc()
 		print tb
 		sys.exit(1)
-	if problem:
-		mode = args["--mode"]
-		if mode not in ["unique", "count", "inclusive"]:
-			raise Exception("Invalid mode: %s" % mode)
-		if args["--print"]:
-			print_problem(problem)
-		solution = optimize(problem, mode)
-		if args["--output"]:
-			write_solution(args["--output"], solution)
+	if not problem:
+		sys.exit(1)
+	mode = args["--mode"]
+	if mode not in ["unique", "count", "inclusive"]:
+		raise Exception("Invalid mode: %s" % mode)
+	strategy = args["--strategy"]
+	if strategy not in ["exact", "portfolio", "hierarchical"]:
+		raise Exception("Invalid strategy: %s" % strategy)
+	jobs = int(args["--jobs"]) if args["--jobs"] else None
+	timeout = float(args["--timeout"]) if args["--timeout"] else None
+	warm_start = not args["--no-warm-start"]
+	greedy_bound = args["--greedy-bound"]
+	objectives = None
+	if args["--objectives"]:
+		objectives = parse_objectives(args["--objectives"])
+		if strategy != "exact":
+			raise Exception("Objectives require exact strategy")
+	if args["--print"]:
+		print_problem(problem)
+	if args["--verify"]:
+		import verify
+		with open(args["--verify"], "r") as f:
+			solution = json.load(f)
+		if not has_system(solution):
+			print "Solution file has no system: %s" % args["--verify"]
+			sys.exit(1)
+		report = verify_solution(problem, solution, mode)
+		if not args["--quiet"]:
+			verify.print_report(report)
+		sys.exit(0 if report["valid"] else 1)
+	if args["--interactive"]:
+		import session
+		session.interact(problem, mode, timeout)
+		return
+	if args["--dry-run"]:
+		prune_problem(problem)
 		if not args["--quiet"]:
 			print_problem_stats(problem)
-			print_solution(solution)
+		return
+	if args["--emit-smt2"]:
+		emit_smt2(args["--emit-smt2"], problem, mode)
+		if not args["--quiet"]:
+			print_problem_stats(problem)
+		return
+	# keep grounded rules before they are pruned, for verification
+	grounded = dict(problem, rules=dict(problem["rules"]))
+	solution = optimize(problem, mode, strategy, jobs, timeout, warm_start,
+		greedy_bound, objectives, args["--pareto"])
+	if has_system(solution):
+		solution["verification"] = verify_solution(grounded, solution, mode)
+	if args["--portfolio-log"] and strategy == "portfolio":
+		import portfolio
+		stats = dict(get_problem_stats(problem))
+		portfolio.log_result(args["--portfolio-log"], stats, mode, solution)
+	if args["--output"]:
+		write_solution(args["--output"], solution)
+	if not args["--quiet"]:
+		print_problem_stats(problem)
+		print_solution(solution)
+		if has_system(solution):
+			print ""
+			import verify
+			verify.print_report(solution["verification"])
 
 if __name__ == "__main__":
 	main()
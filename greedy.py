@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+from time import time
+from heapq import heapify, heappush, heappop
+from collections import Counter
+
+def get_requirements(system, mode):
+	"""
+	Return dict: module -> number of instances required in solution.
+
+	In "unique" and "inclusive" modes each system module counts once.
+	"""
+	counts = Counter(system)
+	if mode in ["unique", "inclusive"]:
+		return {module: 1 for module in counts}
+	return dict(counts)
+
+def get_demands(pedigrees, system, mode):
+	"""
+	Return dict: atom -> number of times atom is covered by `system`.
+	"""
+	required = get_requirements(system, mode)
+	demands = {}
+	for atom, pedigree in pedigrees.iteritems():
+		demands[atom] = sum([required.get(anc, 0) for anc in pedigree])
+	return demands
+
+def get_module_atoms(pedigrees):
+	"""
+	Return dict: module -> list of atoms that module decomposes into.
+	"""
+	module_atoms = {}
+	for atom, pedigree in pedigrees.iteritems():
+		for module in pedigree:
+			module_atoms.setdefault(module, []).append(atom)
+	return module_atoms
+
+def get_admissible(modules, module_atoms, demands, mode="unique"):
+	"""
+	Return list of modules that can be part of a solution.
+
+	In "unique" and "count" modes, these are the modules that do not
+	introduce atoms absent from the system.
+	"""
+	if mode == "inclusive":
+		return list(modules)
+	is_admissible = lambda m : all(demands[a] for a in module_atoms[m])
+	return [m for m in modules if is_admissible(m)]
+
+def get_solution(counts, costs, mode="unique"):
+	"""
+	Return solution dict given `counts` (dict: module -> instances).
+	"""
+	solution = {
+		"cost": sum([n * costs.get(c, 1) for c, n in counts.iteritems()])
+	}
+	if mode == "unique":
+		solution["system"] = [c for c in counts if counts[c] > 0]
+	else:
+		solution["system"] = []
+		for module, units in counts.iteritems():
+			if units > 0:
+				solution["system"] += [module] * units
+	return solution
+
+def cover(modules, pedigrees, system, costs, mode="unique"):
+	"""
+	Find a valid (but not necessarily optimal) cover of the atoms of `system`.
+
+	Modules are picked greedily (cheapest cost per newly covered atom first)
+	and redundant modules are then removed, most expensive first.
+
+	Return dict: module -> instances.
+	"""
+	module_atoms = get_module_atoms(pedigrees)
+	remaining = get_demands(pedigrees, system, mode)
+	admissible = get_admissible(modules, module_atoms, remaining, mode)
+	counts = Counter()
+	def take(module):
+		counts[module] += 1
+		for a in module_atoms[module]:
+			remaining[a] = max(0, remaining[a] - 1)
+	def get_score(module):
+		atoms = module_atoms[module]
+		new = [a for a in atoms if remaining[a]]
+		if not new or (mode == "count" and len(new) < len(atoms)):
+			return None # covers nothing new (or would overshoot a count)
+		return float(costs.get(module, 1)) / len(new)
+	if mode != "count":
+		# modules with negative costs can only lower the cost of a cover
+		for module in admissible:
+			if costs.get(module, 1) < 0:
+				take(module)
+	heap = [(get_score(m), m) for m in admissible]
+	heap = [item for item in heap if item[0] is not None]
+	heapify(heap)
+	while heap:
+		_, module = heappop(heap)
+		score = get_score(module)
+		if score is None:
+			continue
+		if heap and score > heap[0][0]:
+			heappush(heap, (score, module)) # stale score, retry later
+			continue
+		take(module)
+		if mode == "count":
+			heappush(heap, (score, module))
+	if any(remaining.itervalues()):
+		return None
+	if mode != "count":
+		remove_redundant(counts, module_atoms, costs)
+	return dict(counts)
+
+def remove_redundant(counts, module_atoms, costs):
+	"""
+	Remove modules whose atoms are all covered by other modules in `counts`.
+	"""
+	coverage = Counter()
+	for module in counts:
+		coverage.update(module_atoms[module])
+	by_cost = sorted(counts, key=lambda m : costs.get(m, 1), reverse=True)
+	for module in by_cost:
+		if costs.get(module, 1) < 0:
+			continue
+		if all(coverage[a] > 1 for a in module_atoms[module]):
+			del counts[module]
+			coverage.subtract(module_atoms[module])
+
+def solve(modules, pedigrees, system, costs, mode="unique"):
+	"""
+	Return greedy solution (or None if no cover was found).
+	"""
+	start = time()
+	counts = cover(modules, pedigrees, system, costs, mode)
+	if counts is None:
+		return None
+	solution = get_solution(counts, costs, mode)
+	solution["solve_time"] = time() - start
+	solution["optimal"] = False
+	return solution
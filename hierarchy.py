@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+
+import graphs
+import greedy
+import solver
+from z3   import is_int_value
+from time import time
+
+# default time limit (in seconds) of the whole hierarchical solve, and time
+# limit of each level (within the remaining time)
+
+default_timeout = 10
+level_timeout = 2
+
+# shortest time limit worth starting a solve with
+
+min_timeout = 0.01
+
+def get_depths(rules):
+	"""
+	Return dict: module -> depth in rule DAG (atoms have depth 0).
+	"""
+	depths = {}
+	def visit(node):
+		child_depths = [depths[c] for c in rules.get(node, [])]
+		depths[node] = 1 + max(child_depths) if child_depths else 0
+	graphs.traverse_dp(rules, visit)
+	return depths
+
+def get_atom_counts(pedigrees, system, mode="unique"):
+	"""
+	Return dict: atom -> instances, the trivial solution made of atoms.
+	"""
+	demands = greedy.get_demands(pedigrees, system, mode)
+	if mode == "count":
+		return {a: n for a, n in demands.iteritems() if n}
+	return {a: 1 for a, n in demands.iteritems() if n}
+
+def solve_level(candidates, pedigrees, system, costs, mode, timeout=None):
+	"""
+	Solve problem restricted to `candidates`, return dict: module -> count
+	(or None if no solution was found).
+	"""
+	z3_solver, variables = solver.encode(candidates, pedigrees, system, costs,
+		mode)
+	solution = solver.solve(z3_solver, variables, costs, mode, timeout)
+	if solution is None or solution.get("timeout"):
+		return None
+	counts = {}
+	for module in solution["system"]:
+		counts[module] = counts.get(module, 0) + 1
+	return counts
+
+def optimize(rules, modules, pedigrees, system, costs, mode="unique",
+	timeout=None):
+	"""
+	Solve problem level by level, by depth in the rule DAG.
+
+	The search starts from the system's atoms. At each level, the modules
+	selected so far and the modules of the next depth are the only
+	candidates of a (small) subproblem, solved within `level_timeout`
+	seconds. The remaining time is then used for an exact solve of the full
+	problem, which either confirms optimality or reports the gap between the
+	best solution and the solver's lower bound in solution["gap"]. The whole
+	search is limited to `timeout` seconds (default: `default_timeout`).
+
+	The result of the last level is passed to the exact solve as a hint
+	(see solver.add_warm_start), which requires Z3 4.13 or newer. The best
+	of the two solutions is returned.
+	"""
+	start = time()
+	deadline = start + (timeout or default_timeout)
+	get_remaining = lambda : deadline - time()
+	depths = get_depths(rules)
+	module_atoms = greedy.get_module_atoms(pedigrees)
+	demands = greedy.get_demands(pedigrees, system, mode)
+	admissible = greedy.get_admissible(modules, module_atoms, demands, mode)
+	selected = get_atom_counts(pedigrees, system, mode)
+	levels = []
+	for depth in sorted(set(depths[m] for m in admissible)):
+		if depth == 0:
+			continue
+		budget = min(level_timeout, get_remaining())
+		if budget < min_timeout:
+			break # out of time, keep solution of previous level
+		candidates = set(selected)
+		candidates.update(m for m in admissible if depths[m] == depth)
+		counts = solve_level(candidates, pedigrees, system, costs, mode,
+			budget)
+		if counts is not None:
+			selected = counts
+		cost = greedy.get_solution(selected, costs, mode)["cost"]
+		levels.append({"depth": depth, "candidates": len(candidates),
+			"cost": cost})
+	hierarchical = greedy.get_solution(selected, costs, mode)
+	# exact solve of the full problem, within the remaining time
+	solution, lower_bound = None, None
+	budget = get_remaining()
+	if budget >= min_timeout:
+		z3_solver, variables = solver.encode(modules, pedigrees, system,
+			costs, mode, objective=None)
+		objective = solver.get_cost_expr(variables, costs)
+		handle = z3_solver.minimize(objective)
+		solver.add_warm_start(z3_solver, variables, costs, selected)
+		try:
+			solution = solver.solve(z3_solver, variables, costs, mode, budget)
+		except KeyboardInterrupt:
+			solution = None
+		lower = handle.lower()
+		if is_int_value(lower):
+			lower_bound = lower.as_long()
+	if solution is None or solution.get("timeout") or \
+		solution["cost"] > hierarchical["cost"]:
+		solution = dict(hierarchical, optimal=False)
+	if solution["optimal"]:
+		solution["gap"] = 0
+	else:
+		bounded = lower_bound is not None
+		solution["gap"] = solution["cost"] - lower_bound if bounded else None
+	solution["solve_time"] = time() - start
+	solution["hierarchy"] = {"levels": levels, "cost": hierarchical["cost"]}
+	return solution
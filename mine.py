@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+
+import os
+import json
+import docopt
+import resource
+from time            import time
+from parse_sg        import mine_concepts
+from multiprocessing import Pool
+
+usage = """Batch Concept Miner
+
+Mine concepts from many state graph (SG) files in parallel.
+
+Usage:
+  mine.py [--jobs=<n>] [--output=<dir>] [--max-memory=<mb>] [--quiet]
+          <path>...
+
+Options:
+  -j --jobs=<n>         Number of worker processes (default: number of CPUs).
+  -o --output=<dir>     Output directory [default: concepts].
+  -m --max-memory=<mb>  Limit memory of each worker process (in MB).
+  -q --quiet            Suppress progress output.
+
+Each <path> is either an SG file or a directory (searched recursively for
+.sg files). Concepts of each file are written to <dir>/<name>.json and the
+merged, de-duplicated concept set is written to <dir>/merged.json.
+
+"""
+
+def find_sg_files(paths):
+	"""
+	Return list of SG files in `paths` (files or directories), without
+	duplicates.
+	"""
+	files = []
+	for path in paths:
+		if not os.path.isdir(path):
+			files.append(path)
+			continue
+		for root, dirs, names in os.walk(path):
+			dirs.sort()
+			files += [os.path.join(root, n) for n in sorted(names) \
+				if n.endswith(".sg")]
+	seen = set()
+	return [f for f in files if not (f in seen or seen.add(f))]
+
+def limit_memory(max_memory):
+	"""
+	Limit address space of the current process to `max_memory` MB.
+	"""
+	if max_memory:
+		limit = max_memory * 1024 * 1024
+		resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+def mine_file(file):
+	"""
+	Mine concepts of an SG file.
+
+	Return (file, list of concept strings, mining time, error message).
+	"""
+	start = time()
+	try:
+		sg, cause_concepts, or_cause_concepts = mine_concepts(file, False)
+	except MemoryError:
+		return file, [], time() - start, "out of memory"
+	except Exception as e:
+		return file, [], time() - start, str(e)
+	concepts = map(str, cause_concepts + or_cause_concepts)
+	return file, concepts, time() - start, None
+
+def get_output_names(files):
+	"""
+	Return dict: file -> unique output name (without extension).
+	"""
+	names = {}
+	used = set(["merged"])
+	for file in files:
+		base = os.path.splitext(os.path.basename(file))[0]
+		name, k = base, 1
+		while name in used:
+			k += 1
+			name = "%s_%d" % (base, k)
+		used.add(name)
+		names[file] = name
+	return names
+
+def mine_files(files, output, jobs=None, max_memory=None, quiet=False):
+	"""
+	Mine concepts of `files` in a process pool and write results to `output`.
+
+	Each file is mined in a fresh worker process (so that memory used by
+	interned concepts is released) limited to `max_memory` MB.
+
+	Return list of (file, concept count, mining time, error message).
+	"""
+	if not os.path.isdir(output):
+		os.makedirs(output)
+	names = get_output_names(files)
+	pool = Pool(jobs, limit_memory, (max_memory,), maxtasksperchild=1)
+	merged = set()
+	results = []
+	try:
+		items = pool.imap_unordered(mine_file, files)
+		for ind, (file, concepts, elapsed, error) in enumerate(items):
+			if error:
+				status = "error (%s)" % error
+			else:
+				status = "%d concepts" % len(concepts)
+				content = {"file": file, "time": elapsed, "concepts": concepts}
+				with open(os.path.join(output, names[file] + ".json"), "w") as f:
+					json.dump(content, f, indent=4)
+				merged.update(concepts)
+			if not quiet:
+				print "[%d/%d] %-40s : %s (%1.2f sec)" % (ind + 1, len(files),
+					file, status, elapsed)
+			results.append((file, len(concepts), elapsed, error))
+	finally:
+		pool.terminate()
+	content = {
+		"files": [r[0] for r in results if not r[3]],
+		"concepts": sorted(merged)
+	}
+	with open(os.path.join(output, "merged.json"), "w") as f:
+		json.dump(content, f, indent=4)
+	return results
+
+def print_summary(results, slowest=5):
+	failed = [r for r in results if r[3]]
+	print ""
+	print "Mined %d files (%d failed)" % (len(results), len(failed))
+	print ""
+	print "Slowest files:"
+	by_time = sorted(results, key=lambda r : r[2], reverse=True)
+	for file, count, elapsed, error in by_time[:slowest]:
+		print "    - %-40s : %1.2f sec" % (file, elapsed)
+	print ""
+
+def main():
+	args = docopt.docopt(usage)
+	files = find_sg_files(args["<path>"])
+	jobs = int(args["--jobs"]) if args["--jobs"] else None
+	max_memory = int(args["--max-memory"]) if args["--max-memory"] else None
+	results = mine_files(files, args["--output"], jobs, max_memory,
+		args["--quiet"])
+	if not args["--quiet"]:
+		print_summary(results)
+
+if __name__ == "__main__":
+	main()
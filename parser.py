@@ -14,26 +14,44 @@ def split_list(mylist, separators):
 	return sublists
 
 def parse_definitions(definitions):
+	"""
+	Parse a list of (head, body) tuples (see `parse_definition`).
+
+	Return (module_defs, rules) where module_defs is a dict: module name ->
+	(quantifiers, body template) and rules is a list of (head, body
+	template) tuples, one for each definition. Body templates are rule
+	bodies with signals replaced by the indices of head quantifiers (see
+	`get_template`), e.g. "buffer {0} {1} . inverter {1} {0}". Modules
+	that are only used in rule bodies have the body template None.
+	"""
 	module_defs = {}
-	for line in definitions:
-		head, body = parse_definition(line)
-		head_name = head[0]
-		result = {}
-		result["quantifiers"] = len(head) - 1
-		result["children"] = []
+	rules = []
+	for head, body in definitions:
 		head_quantifiers = head[1:]
+		children = []
 		for module in body:
 			name, signals = module[0], module[1:]
 			inds = [head_quantifiers.index(signal) for signal in signals]
-			result["children"].append([name] + inds)
+			children.append(get_template(name, inds))
 			# add child to module_defs
 			if name not in module_defs:
-				module_defs[name] = {
-					"children": [],
-					"quantifiers": len(signals)
-				}
-		module_defs[head_name] = result
-	return module_defs
+				module_defs[name] = (len(signals), None)
+		template = " . ".join(children)
+		module_defs[head[0]] = (len(head_quantifiers), template)
+		rules.append((" ".join(head), template))
+	return module_defs, rules
+
+def merge_definitions(module_defs, other_defs):
+	"""
+	Add `other_defs` to `module_defs`, as if their definitions were parsed
+	after those of `module_defs` (see `parse_definitions`).
+	"""
+	if not module_defs:
+		module_defs.update(other_defs)
+		return
+	for name, definition in other_defs.iteritems():
+		if definition[1] is not None or name not in module_defs:
+			module_defs[name] = definition
 
 def get_signals(system):
 	signals = set()
@@ -43,42 +61,77 @@ def get_signals(system):
 			signals.add(signal)
 	return list(signals)
 
+def get_template(name, inds):
+	"""
+	Return format string of module `name` with the signals at indices
+	`inds` of its arguments (e.g. "buffer {0} {2}" which formats arguments
+	"a", "b", "c" as "buffer a c").
+	"""
+	escaped = name.replace("{", "{{").replace("}", "}}")
+	return " ".join([escaped] + ["{%d}" % ind for ind in inds])
+
+def ground(module_defs, cost_template, signals):
+	"""
+	Expand module definitions over all permutations of `signals`.
+
+	Return (rules, costs, modules with undefined costs).
+	"""
+	rules, costs = {}, {}
+	cost_undef_mods = set() # modules with undefined costs
+	for parent, (child_count, body) in module_defs.iteritems():
+		cost = cost_template.get(parent, 1)
+		head = get_template(parent, range(child_count)).format
+		children = [c.format for c in body.split(" . ")] if body else []
+		grounded = len(costs)
+		for comb in itertools.permutations(signals, child_count):
+			key = head(*comb)
+			costs[key] = cost
+			if children:
+				rules[key] = [child(*comb) for child in children]
+		if parent not in cost_template and len(costs) > grounded:
+			cost_undef_mods.add(parent)
+	return rules, costs, cost_undef_mods
+
 def parse(problem):
+	"""
+	Ground problem whose rules are strings (e.g. loaded from json).
+	"""
+	problem["rules"] = map(parse_definition, problem["rules"])
 	preprocess_problem(problem)
-	definitions = problem["rules"]
+	problem["definitions"], problem["rules"] = \
+		parse_definitions(problem["rules"])
+	return parse_defined(problem)
+
+def parse_defined(problem):
+	"""
+	Ground problem whose rules have been parsed (see `parse_definitions`),
+	i.e. whose "definitions" entry holds module definitions and "rules"
+	entry holds (head, body template) tuples.
+	"""
 	cost_template = problem.get("costs", {})
 	system = problem["system"]
 	signals = get_signals(system)
-	module_defs = parse_definitions(definitions)
-	rules, costs = {}, {}
-	cost_undef_mods = set() # modules with undefined costs
-	for parent in module_defs.keys():
-		cd = module_defs[parent]
-		child_count = cd["quantifiers"]
-		for comb in itertools.permutations(signals, child_count):
-			key = " ".join([parent] + list(comb))
-			costs[key] = cost_template.get(parent, 1)
-			if parent not in cost_template:
-				cost_undef_mods.add(parent)
-			if cd["children"]:
-				rules[key] = []
-				for c in cd["children"]:
-					name, inds = c[0], c[1:]
-					args = [comb[ind] for ind in inds]
-					val = " ".join([name] + args)
-					rules[key].append(val)
+	rules, costs, cost_undef_mods = ground(problem["definitions"],
+		cost_template, signals)
 	problem = {
 		"rules": rules,
 		"costs": costs,
 		"system": system,
 		"source": {
-			"rules": definitions,
+			"rules": problem["rules"],
 			"costs": cost_template,
 			"cost_undef_mods": list(cost_undef_mods)
 		}
 	}
 	return problem
 
+def format_definition(definition):
+	"""
+	Return rule string of a (head, body template) tuple.
+	"""
+	head, body = definition
+	return "%s = %s" % (head, body.format(*head.split()[1:]))
+
 def parse_definition(line):
 	words = line.split()
 	try:
@@ -90,22 +143,18 @@ def parse_definition(line):
 	return head, body
 
 def preprocess_problem(problem=None):
-	meta_rules = problem["input-meta-rules"]
+	meta_rules = problem.get("input-meta-rules", {})
+	if not meta_rules:
+		return
 	gen1 = rule_transformer(meta_rules)
 	gen1.next()
+	transform = lambda module : gen1.send(" ".join(module)).split()
 	# preprocess system
 	problem["system"] = [gen1.send(mod) for mod in problem["system"]]
 	# preprocess rules
 	new_rules = []
-	for line in problem["rules"]:
-		head, body = parse_definition(line)
-		head_str = " ".join(head)
-		new_head_str = gen1.send(head_str)
-		mod_strs = [" ".join(mod) for mod in body]
-		new_mod_strs = [gen1.send(mod_str) for mod_str in mod_strs]
-		new_body_str = " . ".join(new_mod_strs)
-		new_rule = "%s = %s" % (new_head_str, new_body_str)
-		new_rules.append(new_rule)
+	for head, body in problem["rules"]:
+		new_rules.append((transform(head), map(transform, body)))
 	problem["rules"] = new_rules
 
 def rule_transformer(meta_rules):
@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import json
+import solver
+from z3 import set_param
+from time import time
+from Queue import Empty
+from multiprocessing import Process, Queue, cpu_count
+
+# Solver configurations, in order of preference. Configurations with "bool"
+# encoding are skipped in "count" mode.
+
+configs = [
+	{"name": "int", "encoding": "int", "objective": "linear"},
+	{"name": "bool", "encoding": "bool", "objective": "linear"},
+	{
+		"name": "bool-maxres",
+		"encoding": "bool",
+		"objective": "soft",
+		"maxsat_engine": "maxres"
+	},
+	{
+		"name": "bool-wmax",
+		"encoding": "bool",
+		"objective": "soft",
+		"maxsat_engine": "wmax"
+	},
+	{
+		"name": "bool-pd-maxres",
+		"encoding": "bool",
+		"objective": "soft",
+		"maxsat_engine": "pd-maxres"
+	},
+	{"name": "int-seed1", "encoding": "int", "objective": "linear", "seed": 1},
+	{"name": "int-seed2", "encoding": "int", "objective": "linear", "seed": 2},
+	{"name": "bool-seed1", "encoding": "bool", "objective": "linear", "seed": 1},
+]
+
+def get_configs(mode, jobs=None):
+	"""
+	Return list of configurations applicable to `mode`.
+
+	At most `jobs` configurations are returned (default: number of CPUs).
+	"""
+	applicable = [c for c in configs if mode != "count" or \
+		c["encoding"] == "int"]
+	return applicable[:jobs or cpu_count()]
+
+def run_config(queue, config, modules, pedigrees, system, costs, mode):
+	"""
+	Solve problem using `config` and put (config name, solution) in `queue`.
+	"""
+	if "seed" in config:
+		set_param("smt.random_seed", config["seed"])
+		set_param("sat.random_seed", config["seed"])
+	z3_solver, variables = solver.encode(modules, pedigrees, system, costs,
+		mode, config["encoding"], config["objective"])
+	if "maxsat_engine" in config:
+		z3_solver.set("maxsat_engine", config["maxsat_engine"])
+	solution = solver.solve(z3_solver, variables, costs, mode)
+	queue.put((config["name"], solution))
+
+def is_conclusive(solution):
+	"""
+	Return True if `solution` is proven optimal or the problem is unsat.
+	"""
+	return solution is None or solution["optimal"]
+
+def get_best(results):
+	"""
+	Return best (config name, solution) of inconclusive `results`.
+	"""
+	found = [r for r in results if "system" in r[1]]
+	if found:
+		return min(found, key=lambda r : r[1]["cost"])
+	return results[0]
+
+def optimize(modules, pedigrees, system, costs, mode="unique", jobs=None):
+	"""
+	Solve problem using a portfolio of solver configurations.
+
+	Each configuration runs in a separate process. The first result that is
+	conclusive (a proven optimal solution or unsat) is returned and the
+	remaining processes are terminated. If no configuration is conclusive,
+	the best solution found is returned (with solution["optimal"] set to
+	False). The winning configuration is recorded in solution["portfolio"].
+	"""
+	start = time()
+	queue = Queue()
+	portfolio = get_configs(mode, jobs)
+	processes = []
+	for config in portfolio:
+		args = (queue, config, modules, pedigrees, system, costs, mode)
+		p = Process(target=run_config, args=args)
+		p.daemon = True
+		p.start()
+		processes.append(p)
+	result = None
+	inconclusive = [] # list of (config name, solution)
+	try:
+		while result is None:
+			try:
+				item = queue.get(timeout=0.1)
+			except Empty:
+				if not any(p.is_alive() for p in processes) and queue.empty():
+					if not inconclusive:
+						raise Exception("All portfolio configurations failed")
+					result = get_best(inconclusive)
+				continue
+			if is_conclusive(item[1]):
+				result = item
+			else:
+				inconclusive.append(item)
+	finally:
+		for p in processes:
+			if p.is_alive():
+				p.terminate()
+	name, solution = result
+	if solution is not None:
+		solution["portfolio"] = {
+			"winner": name,
+			"configs": [c["name"] for c in portfolio],
+			"time": time() - start
+		}
+	return solution
+
+def log_result(file, stats, mode, solution):
+	"""
+	Append the winning configuration and problem statistics to a log file.
+
+	The log contains one json object per line.
+	"""
+	entry = {
+		"mode": mode,
+		"stats": stats,
+		"winner": solution["portfolio"]["winner"] if solution else None,
+		"optimal": solution["optimal"] if solution else None,
+		"time": solution["portfolio"]["time"] if solution else None
+	}
+	with open(file, "a") as f:
+		f.write(json.dumps(entry) + "\n")
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+import graphs
+import greedy
+import solver
+from copter      import get_family, get_pedigrees
+from z3          import Bool, Implies
+from collections import Counter
+
+# z3's default solver timeout (no timeout)
+
+no_timeout = 4294967295
+
+class Session(object):
+	"""
+	Incremental optimization session.
+
+	A session keeps a grounded problem and its solver alive while modules
+	are added to or removed from the system. System requirements are
+	guarded by literals (one per atom and requirement) that are only
+	asserted, within a solver scope, for the duration of each solve, so
+	re-solving after an edit reuses the encoding.
+
+	(The literals are asserted rather than passed as check() assumptions,
+	since z3's optimizer does not reliably minimize under assumptions.)
+
+	Like a cold solve, the encoding only covers the family of the system's
+	modules (see copter.get_family). Removing modules keeps the encoding.
+	Adding a module whose lineage reaches beyond the encoded family (even
+	if the module itself is a member) enlarges the family, and the problem
+	is re-encoded at the next solve. (The encoding cannot be extended in
+	place, since a larger family can change how existing atoms decompose.)
+	Modules can only be added if they are part of the grounded problem,
+	i.e. their signals appear in the system the problem was loaded with.
+
+	Example:
+
+		session = Session(problem, "unique")
+		solution = session.solve()
+		session.add("buffer a c")
+		session.remove("buffer b c")
+		solution = session.solve()
+	"""
+
+	def __init__(self, problem, mode="unique"):
+		self.mode = mode
+		self.rules = problem["rules"]
+		self.costs = problem.get("costs", {})
+		self.nodes = set(graphs.get_nodes(self.rules))
+		self.closure = graphs.get_closure(self.rules)
+		self.rev_closure = graphs.get_closure(graphs.get_reversed(self.rules))
+		self.system = Counter()
+		self.seen = set() # modules that have been part of the system
+		self.family = set() # family of modules seen so far
+		self.solver = None
+		for module in problem["system"]:
+			self.add(module)
+
+	def encode(self):
+		"""
+		Encode family of all modules seen so far.
+		"""
+		rules = {k:v for k,v in self.rules.iteritems() if k in self.family}
+		self.modules = set(graphs.get_nodes(rules))
+		self.pedigrees = get_pedigrees(rules)
+		self.module_atoms = greedy.get_module_atoms(self.pedigrees)
+		self.requirements = {} # dict: (atom, requirement) -> z3_bool
+		self.solver, self.variables, self.coverage = solver.encode_session(
+			self.modules, self.pedigrees, self.costs, self.mode)
+
+	def add(self, module):
+		"""
+		Add an instance of `module` to the system.
+		"""
+		if module not in self.nodes:
+			raise Exception("Module is not in grounded problem: %s" % module)
+		if module not in self.seen:
+			# the family of a system is the union of its modules' families
+			family = get_family([module], self.closure, self.rev_closure)
+			if not family.issubset(self.family):
+				self.family.update(family)
+				self.solver = None # re-encode at next solve
+			self.seen.add(module)
+		self.system[module] += 1
+
+	def remove(self, module):
+		"""
+		Remove an instance of `module` from the system.
+		"""
+		if not self.system[module]:
+			raise Exception("Module is not in system: %s" % module)
+		self.system[module] -= 1
+
+	def get_system(self):
+		return list(self.system.elements())
+
+	def get_assumption(self, atom, demand):
+		"""
+		Return solver literal enforcing `demand` of `atom` (or None if the
+		atom is unconstrained).
+
+		Literals are created (and their constraints added) on first use.
+		"""
+		coverage = self.coverage[atom]
+		if self.mode == "count":
+			key, constraint = (atom, demand), coverage == demand
+		elif demand > 0:
+			key, constraint = (atom, "covered"), coverage > 0
+		elif self.mode == "unique":
+			key, constraint = (atom, "uncovered"), coverage == 0
+		else:
+			return None
+		if key not in self.requirements:
+			literal = Bool("requirement!%d" % len(self.requirements))
+			self.solver.add(Implies(literal, constraint))
+			self.requirements[key] = literal
+		return self.requirements[key]
+
+	def get_exclusion(self, module):
+		"""
+		Return solver literal excluding `module` from solutions.
+		"""
+		key = (module, "excluded")
+		if key not in self.requirements:
+			literal = Bool("requirement!%d" % len(self.requirements))
+			var = self.variables[module]
+			self.solver.add(Implies(literal, var == 0))
+			self.requirements[key] = literal
+		return self.requirements[key]
+
+	def solve(self, timeout=None):
+		"""
+		Optimize current system and return solution, see solver.solve (None
+		if unsat, or a timeout result if no solution was found within
+		`timeout` seconds).
+		"""
+		if self.solver is None:
+			self.encode()
+		demands = greedy.get_demands(self.pedigrees, self.get_system(),
+			self.mode)
+		assumptions = [self.get_assumption(a, n) for a, n in demands.iteritems()]
+		assumptions = [x for x in assumptions if x is not None]
+		# modules that introduce undemanded atoms are excluded explicitly
+		# (implied by the requirements, but much faster to propagate)
+		admissible = greedy.get_admissible(self.modules, self.module_atoms,
+			demands, self.mode)
+		excluded = self.modules.difference(admissible)
+		assumptions += [self.get_exclusion(m) for m in excluded]
+		self.solver.set("timeout", int(timeout * 1000) if timeout else \
+			no_timeout)
+		self.solver.push()
+		try:
+			self.solver.add(assumptions)
+			return solver.solve(self.solver, self.variables, self.costs,
+				self.mode)
+		finally:
+			self.solver.pop()
+
+commands = """Commands:
+
+  + <module>    Add module instance to system.
+  - <module>    Remove module instance from system.
+  solve         Optimize system.
+  system        Print system.
+  help          Print this message.
+  quit          Exit.
+"""
+
+def interact(problem, mode="unique", timeout=None):
+	"""
+	Run interactive session (reading commands from stdin).
+	"""
+	from copter import print_solution
+	session = Session(problem, mode)
+	print commands
+	while True:
+		try:
+			line = raw_input("copter> ").strip()
+		except EOFError:
+			print ""
+			break
+		if not line:
+			continue
+		cmd, _, module = line.partition(" ")
+		module = " ".join(module.split())
+		try:
+			if cmd == "+":
+				session.add(module)
+			elif cmd == "-":
+				session.remove(module)
+			elif cmd == "solve":
+				print_solution(session.solve(timeout))
+			elif cmd == "system":
+				print " . ".join(session.get_system())
+			elif cmd == "help":
+				print commands
+			elif cmd in ["quit", "exit"]:
+				break
+			else:
+				print "Unknown command: %s" % cmd
+		except Exception as e:
+			print "Error: %s" % e
@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+
+import sys
+import json
+import docopt
+import parser
+import copter
+from parse_sg     import mine_concepts
+from itertools    import product
+from itertools    import starmap
+from itertools    import combinations
+from itertools    import permutations
+from concepts     import *
+
+usage = """SG Concept Pipeline
+
+Mine concepts from a Workcraft state graph (SG) file and produce a Copter
+problem in which the mined concepts are the system and composite concepts
+(causes, gates, buffers, handshakes ...) supported by them are the rules.
+
+Usage:
+  sg_pipeline.py [--output=<file>] [--costs=<list>] [--solve] [--mode=<m>]
+                 [--quiet] <file.sg>
+
+Options:
+  -o --output=<file>  Write problem to json file.
+  -c --costs=<list>   Concept costs (<list> is kind1:cost1,kind2:cost2 ...).
+  -s --solve          Optimize problem using Copter.
+  -m --mode=<m>       Choose optimization mode [default: unique].
+  -q --quiet          Suppress output.
+
+"""
+
+def get_kind(concept):
+	"""
+	Return concept kind (e.g. "cause", "or_cause", "norGate").
+	"""
+	return str(concept).split()[0]
+
+def get_module(concept):
+	"""
+	Return Copter module name of a concept (e.g. "cause(a+,b-)").
+
+	Module names contain no spaces so that rules are not parameterized.
+	"""
+	words = str(concept).split()
+	return "%s(%s)" % (words[0], ",".join(words[1:]))
+
+def get_literals(signals):
+	return list(starmap(Literal, product(signals, "+-")))
+
+def match_causes(index, signals):
+	"""
+	cause x y = or_cause x z y . ... (for all literals z of other signals)
+	"""
+	literals = get_literals(signals)
+	for cond, tran in permutations(literals, 2):
+		if cond.signal == tran.signal:
+			continue
+		other = [z for z in literals if z.signal not in [cond.signal, tran.signal]]
+		children = [OrCause(cond, z, tran) for z in other]
+		if children and all(x in index for x in children):
+			yield Cause(cond, tran), children
+
+# gate templates: (concept, or_cause polarities, cause polarities)
+# e.g. "norGate a b y = or_cause a+ b+ y- . cause a- y+ . cause b- y+"
+
+gates = [
+	(OrGate,  "++", "--"),
+	(AndGate, "--", "++"),
+	(NorGate, "+-", "-+"),
+]
+
+def match_gates(index, signals):
+	for y in signals:
+		inputs = [s for s in signals if s != y]
+		for a, b in combinations(inputs, 2):
+			for concept, or_pols, cause_pols in gates:
+				in_pol, out_pol = or_pols
+				cond_pol, tran_pol = cause_pols
+				children = [
+					OrCause(Literal(a, in_pol), Literal(b, in_pol),
+						Literal(y, out_pol)),
+					Cause(Literal(a, cond_pol), Literal(y, tran_pol)),
+					Cause(Literal(b, cond_pol), Literal(y, tran_pol))
+				]
+				if all(x in index for x in children):
+					yield concept(a, b, y), children
+
+def match_buffers(index, signals):
+	"""
+	buffer a y = cause a+ y+ . cause a- y-
+	inverter a y = cause a+ y- . cause a- y+
+	"""
+	for a, y in permutations(signals, 2):
+		buffer_children = [
+			Cause(Literal(a, "+"), Literal(y, "+")),
+			Cause(Literal(a, "-"), Literal(y, "-"))
+		]
+		inverter_children = [
+			Cause(Literal(a, "+"), Literal(y, "-")),
+			Cause(Literal(a, "-"), Literal(y, "+"))
+		]
+		if all(x in index for x in buffer_children):
+			yield Buffer(a, y), buffer_children
+		if all(x in index for x in inverter_children):
+			yield Inverter(a, y), inverter_children
+
+def match_handshakes(index, signals):
+	"""
+	cElement a b y = buffer a y . buffer b y
+	handshake b c = buffer b c . inverter c b
+	"""
+	for y in signals:
+		inputs = [s for s in signals if s != y]
+		for a, b in combinations(inputs, 2):
+			children = [Buffer(a, y), Buffer(b, y)]
+			if all(x in index for x in children):
+				yield CElement(a, b, y), children
+	for b, c in permutations(signals, 2):
+		children = [Buffer(b, c), Inverter(c, b)]
+		if all(x in index for x in children):
+			yield Handshake(b, c), children
+
+# templates, in order of dependency
+
+templates = [
+	match_causes,
+	match_gates,
+	match_buffers,
+	match_handshakes,
+]
+
+def match_templates(concepts, signals):
+	"""
+	Generate (composite concept, children) pairs supported by `concepts`.
+
+	Matched composite concepts are added to the index and can be children of
+	concepts matched by later templates.
+	"""
+	index = set(concepts)
+	for template in templates:
+		for parent, children in template(index, signals):
+			index.add(parent)
+			yield parent, children
+
+def get_problem(concepts, signals, kind_costs={}):
+	"""
+	Return Copter problem (rules, costs and system) for mined `concepts`.
+
+	`kind_costs` is a dict: concept kind -> cost (default cost is 1).
+	"""
+	rules = []
+	costs = {}
+	modules = set(concepts)
+	for parent, children in match_templates(concepts, signals):
+		body = " . ".join(map(get_module, children))
+		rules.append("%s = %s" % (get_module(parent), body))
+		modules.add(parent)
+		modules.update(children)
+	for concept in modules:
+		costs[get_module(concept)] = kind_costs.get(get_kind(concept), 1)
+	return {
+		"rules": rules,
+		"costs": costs,
+		"system": map(get_module, concepts)
+	}
+
+def load_sg_problem(file, kind_costs={}):
+	"""
+	Mine concepts from SG file and return Copter problem.
+	"""
+	sg, cause_concepts, or_cause_concepts = mine_concepts(file, False)
+	concepts = cause_concepts + or_cause_concepts
+	return get_problem(concepts, sg.encoding, kind_costs)
+
+def parse_costs(costs_str):
+	"""
+	Parse string in the form 'kind1:cost1,kind2:cost2...'.
+	"""
+	kind_costs = {}
+	if costs_str:
+		for item in costs_str.split(","):
+			kind, cost_str = item.split(":")
+			kind_costs[kind] = int(cost_str)
+	return kind_costs
+
+def main():
+	args = docopt.docopt(usage)
+	content = load_sg_problem(args["<file.sg>"], parse_costs(args["--costs"]))
+	if args["--output"]:
+		with open(args["--output"], "w") as f:
+			json.dump(content, f, indent=4)
+	if not args["--solve"]:
+		if not args["--output"] and not args["--quiet"]:
+			print json.dumps(content, indent=4)
+		return
+	mode = args["--mode"]
+	if mode not in ["unique", "count", "inclusive"]:
+		raise Exception("Invalid mode: %s" % mode)
+	content["input-meta-rules"] = {}
+	problem = parser.parse(content)
+	solution = copter.optimize(problem, mode)
+	if copter.has_system(solution):
+		solution["verification"] = copter.verify_solution(problem,
+			solution, mode)
+	if not args["--quiet"]:
+		copter.print_problem_stats(problem)
+		copter.print_solution(solution)
+	if not copter.has_system(solution) or \
+		not solution["verification"]["valid"]:
+		sys.exit(1)
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+
+import json
+from z3 import *
+from time import time
+from greedy import get_requirements
+from greedy import get_solution
+
+def encode(modules, pedigrees, system, costs, mode="unique",
+	encoding="int", objective="linear"):
+	"""
+	Encode optimization problem as a Z3 Optimize instance.
+
+	`pedigrees` is a dict: atom -> list of modules that decompose into atom
+	(including atom itself). Modules in pedigrees but not in `modules` are
+	excluded from the solution.
+
+	`encoding` is either "int" (one integer per module) or "bool" (one boolean
+	per module, only valid in "unique" and "inclusive" modes).
+
+	`objective` is either "linear" (minimize the sum of module costs), "soft"
+	(a weighted MaxSAT objective, only valid with "bool" encoding) or None
+	(no objective, see `add_objectives`).
+
+	Return (solver, variables) where `variables` is a dict: module -> z3_var.
+	"""
+	if encoding == "bool" and mode == "count":
+		raise Exception("Bool encoding is not supported in count mode")
+	if objective == "soft" and encoding != "bool":
+		raise Exception("Soft objective requires bool encoding")
+
+	solver = Optimize()
+
+	d = {} # dict: module -> z3_var
+
+	# note: iff is no longer needed but removing it causes a segmentation
+	# fault for some reason (TODO: debug)
+	iff = Function('iff', BoolSort(), BoolSort(), BoolSort())
+	solver.add(iff(False, False) == True)
+	solver.add(iff(False, True)  == False)
+	solver.add(iff(True,  False) == False)
+	solver.add(iff(True,  True)  == True)
+
+	# constraints
+
+	for module in modules:
+		if encoding == "bool":
+			d[module] = Bool(module) # Z3 object
+			continue
+		mod = Int(module) # Z3 object
+		d[module] = mod
+		if mode in ["unique", "inclusive"]:
+			constraint = Or(mod == 0, mod == 1)
+		elif mode == "count":
+			constraint = mod >= 0
+		solver.add(constraint)
+
+	required = get_requirements(system, mode)
+
+	for a, pedigree in pedigrees.iteritems():
+		s1 = sum([required.get(ancestor, 0) for ancestor in pedigree])
+		p2 = [d[ancestor] for ancestor in pedigree if ancestor in d]
+		if encoding == "bool":
+			covered = Or(p2) if p2 else BoolVal(False) # Z3 object
+			if mode == "unique":
+				solver.add(covered if (s1>0) else Not(covered))
+			elif mode == "inclusive":
+				if s1>0:
+					solver.add(covered)
+			continue
+		s2 = sum(p2) # Z3 object
+		if mode == "unique":
+			solver.add((s2>0) if (s1>0) else (s2==0))
+		elif mode == "inclusive":
+			if s1>0:
+				solver.add(s2>0)
+		elif mode == "count":
+			solver.add(s1 == s2)
+
+	if objective == "soft":
+		for module in modules:
+			cost = costs.get(module, 1)
+			if cost > 0:
+				solver.add_soft(Not(d[module]), cost)
+			elif cost < 0:
+				solver.add_soft(d[module], -cost)
+	elif objective == "linear":
+		solver.minimize(get_cost_expr(d, costs))
+
+	return solver, d
+
+def encode_session(modules, pedigrees, costs, mode="unique"):
+	"""
+	Encode problem without system requirements, for incremental solving
+	(see session.py).
+
+	Return (solver, variables, coverage) where `coverage` is a dict: atom ->
+	Z3 expression of the number of modules covering the atom.
+	"""
+	solver, variables = encode(modules, {}, [], costs, mode)
+	coverage = {}
+	for a, pedigree in pedigrees.iteritems():
+		coverage[a] = sum([variables[m] for m in pedigree if m in variables])
+	return solver, variables, coverage
+
+def get_module_name(module):
+	"""
+	Return name of `module` without parameters (e.g. "buffer" for both
+	"buffer a b" and "buffer(a,b)").
+	"""
+	return module.split()[0].split("(")[0]
+
+def matches(module, names):
+	"""
+	Return True if `module` or its name (see `get_module_name`) is in
+	`names`.
+	"""
+	return module in names or get_module_name(module) in names
+
+def add_objectives(solver, variables, costs, objectives, pareto=False):
+	"""
+	Add prioritized objectives to solver.
+
+	`objectives` is a list of (kind, names) tuples where kind is one of:
+
+	- "cost"    : minimize total cost.
+	- "modules" : minimize number of modules.
+	- "exclude" : minimize number of modules in `names`.
+	- "require" : maximize number of modules in `names`.
+
+	Each name must match at least one module (see `matches`). Objectives are
+	optimized lexicographically, in order, or as a Pareto
+	front if `pareto` is True.
+
+	Return list of (objective name, z3 expression).
+	"""
+	solver.set("priority", "pareto" if pareto else "lex")
+	result = []
+	for kind, names in objectives:
+		for name in names:
+			if not any(matches(m, [name]) for m in variables):
+				raise Exception("No module matches objective: %s" % name)
+		if kind == "cost":
+			expr = get_cost_expr(variables, costs)
+		else:
+			selected = {m: v for m, v in variables.iteritems() \
+				if kind == "modules" or matches(m, names)}
+			expr = get_cost_expr(selected, {})
+		if kind == "require":
+			solver.maximize(expr)
+		else:
+			solver.minimize(expr)
+		name = ":".join([kind, "+".join(names)]) if names else kind
+		result.append((name, expr))
+	return result
+
+def get_cost_expr(variables, costs):
+	"""
+	Return Z3 expression of the total cost of modules in `variables`.
+	"""
+	cost_list = []
+	for module, var in variables.iteritems():
+		cost = costs.get(module, 1)
+		if is_bool(var):
+			cost_list.append(If(var, cost, 0))
+		else:
+			cost_list.append(var * cost)
+	return sum(cost_list) if cost_list else IntVal(0)
+
+def get_count(model, var):
+	"""
+	Return number of module instances assigned to `var` in `model`.
+	"""
+	val = model.eval(var, model_completion=True)
+	if is_bool(val):
+		return 1 if is_true(val) else 0
+	return val.as_long()
+
+def add_warm_start(solver, variables, costs, counts, bound=False):
+	"""
+	Hint the assignment of a known solution (and optionally bound the
+	objective by its cost).
+
+	`counts` is a dict: module -> instances (e.g. a greedy cover).
+
+	Note: with Z3 4.8 the bound can prevent the optimizer from proving
+	optimality in reasonable time, so it is disabled by default.
+	"""
+	if bound:
+		cost = sum([n * costs.get(c, 1) for c, n in counts.iteritems()])
+		solver.add(get_cost_expr(variables, costs) <= cost)
+	if not hasattr(solver, "set_initial_value"):
+		return # phase hints require Z3 4.13 or newer
+	for module, var in variables.iteritems():
+		units = counts.get(module, 0)
+		solver.set_initial_value(var, units > 0 if is_bool(var) else units)
+
+def get_timeout(solve_time):
+	"""
+	Return result of a solver run that stopped before finding a solution.
+
+	Timeout results have no "system" or "cost" entries.
+	"""
+	return {"timeout": True, "optimal": False, "solve_time": solve_time}
+
+def solve(solver, variables, costs, mode="unique", timeout=None,
+	objectives=[]):
+	"""
+	Run solver and return solution (or None if problem is unsat).
+
+	If the solver times out (`timeout` is in seconds) or is interrupted then
+	the best solution found so far is returned with solution["optimal"] set
+	to False (or a timeout result, see `get_timeout`, if no solution was
+	found).
+
+	The values of `objectives` (see `add_objectives`) are included in the
+	solution as a list of (objective name, value) pairs.
+	"""
+	if timeout:
+		solver.set("timeout", int(timeout * 1000))
+	start_solve = time()
+	result = solver.check()
+	end_solve = time()
+	if result == unsat:
+		return None
+	try:
+		m = solver.model()
+	except Z3Exception:
+		return get_timeout(end_solve - start_solve)
+	if result != sat:
+		# models of interrupted runs are not guaranteed to be valid
+		holds = lambda a : is_true(m.eval(a, model_completion=True))
+		if not all(holds(a) for a in solver.assertions()):
+			return get_timeout(end_solve - start_solve)
+	counts = {c:get_count(m, v) for c, v in variables.iteritems()}
+	solution = get_solution(counts, costs, mode)
+	solution["solve_time"] = (end_solve - start_solve).real
+	solution["optimal"] = result == sat
+	if objectives:
+		value = lambda e : m.eval(e, model_completion=True).as_long()
+		solution["objectives"] = [(n, value(e)) for n, e in objectives]
+	return solution
+
+def solve_pareto(solver, variables, costs, mode="unique", timeout=None,
+	objectives=[]):
+	"""
+	Enumerate Pareto-optimal solutions (requires objectives added with
+	`pareto` set to True).
+
+	Return the first solution, with the list of all Pareto-optimal solutions
+	in solution["pareto"] (or None if problem is unsat).
+	"""
+	front = []
+	while True:
+		solution = solve(solver, variables, costs, mode, timeout, objectives)
+		if solution is None or not solution["optimal"]:
+			break
+		front.append(solution)
+	if not front:
+		return solution
+	front[0]["pareto"] = [dict(s) for s in front]
+	return front[0]
+
+def get_sidecar_file(file):
+	"""
+	Return name of the file mapping SMT-LIB2 variables to modules.
+	"""
+	return file + ".json"
+
+def write_smt2(file, solver, variables, costs, mode="unique"):
+	"""
+	Write encoded problem to an SMT-LIB2 file.
+
+	Variable names, module costs and the optimization mode are written to a
+	sidecar json file (see `get_sidecar_file`) so that solutions can be
+	recovered by `read_smt2`.
+	"""
+	with open(file, "w") as f:
+		f.write(solver.sexpr())
+	is_bool_encoded = any(is_bool(v) for v in variables.itervalues())
+	sidecar = {
+		"mode": mode,
+		"encoding": "bool" if is_bool_encoded else "int",
+		"variables": {str(v): module for module, v in variables.iteritems()},
+		"costs": {module: costs.get(module, 1) for module in variables}
+	}
+	with open(get_sidecar_file(file), "w") as f:
+		json.dump(sidecar, f, indent=4)
+
+def read_smt2(file):
+	"""
+	Load a problem written by `write_smt2`.
+
+	Return (solver, variables, costs, mode).
+	"""
+	with open(get_sidecar_file(file), "r") as f:
+		sidecar = json.load(f)
+	solver = Optimize()
+	solver.from_file(file)
+	items = sidecar["variables"].iteritems()
+	mk_var = Bool if sidecar.get("encoding") == "bool" else Int
+	variables = {module: mk_var(name) for name, module in items}
+	return solver, variables, sidecar["costs"], sidecar["mode"]
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+from collections import Counter
+
+class Signatures(object):
+	"""
+	Per-module atom signatures of a set of rules.
+
+	The signature of a module is a bitmask of the atoms it decomposes into
+	(bit i corresponds to atom `atoms[i]`). Signatures are computed bottom-up
+	and cached, so each module is expanded only once.
+	"""
+
+	def __init__(self, rules):
+		self.rules = rules
+		self.atoms = [] # list of atoms
+		self.index = {} # dict: atom -> bit index
+		self.cache = {} # dict: module -> signature
+
+	def get(self, module):
+		"""
+		Return signature of `module`.
+		"""
+		if module in self.cache:
+			return self.cache[module]
+		stack = [module]
+		while stack:
+			node = stack[-1]
+			children = self.rules.get(node, [])
+			pending = [c for c in children if c not in self.cache]
+			if pending:
+				stack += pending
+				continue
+			stack.pop()
+			if node in self.cache:
+				continue
+			if children:
+				signature = 0
+				for child in children:
+					signature |= self.cache[child]
+			else:
+				signature = 1 << self.get_index(node)
+			self.cache[node] = signature
+		return self.cache[module]
+
+	def get_index(self, atom):
+		if atom not in self.index:
+			self.index[atom] = len(self.atoms)
+			self.atoms.append(atom)
+		return self.index[atom]
+
+	def decode(self, signature):
+		"""
+		Return list of atoms in `signature`.
+		"""
+		result = []
+		while signature:
+			low = signature & -signature
+			result.append(self.atoms[low.bit_length() - 1])
+			signature ^= low
+		return result
+
+def expand(signatures, system, mode="unique"):
+	"""
+	Return the atoms of `system` as a Counter: atom -> instances.
+
+	In "unique" and "inclusive" modes each atom is counted once.
+	"""
+	if mode in ["unique", "inclusive"]:
+		combined = 0
+		for module in set(system):
+			combined |= signatures.get(module)
+		return Counter(signatures.decode(combined))
+	atoms = Counter()
+	for module, instances in Counter(system).iteritems():
+		for atom in signatures.decode(signatures.get(module)):
+			atoms[atom] += instances
+	return atoms
+
+def verify(rules, system, solution_system, mode="unique"):
+	"""
+	Check that `solution_system` is equivalent to `system` under `mode`.
+
+	Return a report dict with the keys:
+
+	- "valid"   : True if the systems are equivalent.
+	- "missing" : atoms of `system` that are not in `solution_system`.
+	- "extra"   : atoms of `solution_system` that are not in `system`
+	              (allowed in "inclusive" mode).
+
+	Atoms that differ in count (in "count" mode) are repeated accordingly.
+	"""
+	signatures = Signatures(rules)
+	expected = expand(signatures, system, mode)
+	actual = expand(signatures, solution_system, mode)
+	missing = sorted((expected - actual).elements())
+	extra = sorted((actual - expected).elements())
+	valid = not missing and (mode == "inclusive" or not extra)
+	return {"valid": valid, "missing": missing, "extra": extra}
+
+def print_report(report):
+	print "Verification: %s" % ("passed" if report["valid"] else "failed")
+	for key in ["missing", "extra"]:
+		if report[key]:
+			print ""
+			print "%s atoms:" % key.capitalize()
+			for atom in report[key]:
+				print "    - %s" % atom
+	print ""